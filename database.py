@@ -1,7 +1,10 @@
+import atexit
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, List, Any, Optional
 import logging
-from pymongo import MongoClient, database
+from pymongo import MongoClient, InsertOne, collection, database
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.write_concern import WriteConcern
 
 import setup 
 
@@ -19,20 +22,25 @@ class MongoDBHandler:
 
     def __init__(self, host: str = 'localhost', port: int = 27017) -> None:
         self.client = MongoClient(host, port)
-        self.failed_books_db = self._get_or_create_database('failed_evidence_books')
-        self.books_metadata_db = self._get_or_create_database('evidence_books_metadata')
-
-    def _get_or_create_database(self, db_name: str) -> database.Database:
-        """Get or create a MongoDB database.
+        self.failed_books_db = self._get_database('failed_evidence_books')
+        self.books_metadata_db = self._get_database('evidence_books_metadata')
+        self.failed_col = self.failed_books_db.get_collection('data', write_concern=WriteConcern(w=0))
+        self.meta_col = self.books_metadata_db['data']
+        self.meta_col.create_index([('id', 1)], background=True)
+        self.failed_books_db['data'].create_index([('book_id', 1)], background=True)
+        self._BATCH = {'failed': 1000, 'meta': 1}
+        self._buf = {'failed': [], 'meta': []}
+        atexit.register(self.close)
+
+    def _get_database(self, db_name: str) -> database.Database:
+        """Get a MongoDB database. MongoDB creates it on the first write if it does not exist yet.
 
         Args:
-            db_name (str): The name of the database to get or create.
+            db_name (str): The name of the database.
 
         Returns:
             database.Database: The MongoDB database object.
         """
-        if db_name not in self.client.list_database_names():
-            logger.info(f"Creating database: {db_name}")
         return self.client[db_name]
 
     def append_to_failed_books(self, book_id: str, reason: str) -> None:
@@ -43,7 +51,7 @@ class MongoDBHandler:
             reason str: reason of failure. 
         """
         data = {'book_id': book_id, 'reason': reason}
-        self._append_data(self.failed_books_db, data)
+        self._append_data(self.failed_col, 'failed', data)
 
     def append_to_books_metadata(self, data: Dict[str, Any]) -> None:
         """Append data to the books_metadata database.
@@ -51,29 +59,84 @@ class MongoDBHandler:
         Args:
             data (Dict[str, Any]): The books metadata to be appended.
         """
-        self._append_data(self.books_metadata_db, data)
+        self._append_data(self.meta_col, 'meta', data)
+
+    def _append_data(self, col: collection.Collection, buf_name: str, data: Dict[str, Any]) -> None:
+        """Buffer data for a specified MongoDB collection and flush it once its batch is full.
 
-    def _append_data(self, db: database.Database, data: Dict[str, Any]) -> None:
-        """Append data to a specified MongoDB database with an injection timestamp.
+        Failed books are batched by the thousand, while the rare and valuable metadata
+        documents are written one by one, so a killed process loses no found book.
 
         Args:
-            db (database.Database): The database to which the data should be appended.
+            col (collection.Collection): The collection to which the data should be appended.
+            buf_name (str): The buffer of that collection, 'failed' or 'meta'.
             data (Dict[str, Any]): The data to append.
         """ 
-        data['injection_timestamp'] = datetime.now()
-        db['data'].insert_one(data)
-        logger.info(f"Data appended to {db.name} at {data['injection_timestamp']}.")
+        buf = self._buf[buf_name]
+        buf.append(data)
+        if len(buf) >= self._BATCH[buf_name]:
+            # Sourcing resumes after the last stored failure, so no failure may be stored before
+            # the metadata of the books found ahead of it.
+            if buf_name == 'failed':
+                self._flush(self.meta_col, self._buf['meta'])
+            self._flush(col, buf)
+
+    def _flush(self, col: collection.Collection, buf: List[Dict[str, Any]]) -> None:
+        """Write buffered data to a specified MongoDB collection with an injection timestamp.
+
+        Args:
+            col (collection.Collection): The collection to which the data should be appended.
+            buf (List[Dict[str, Any]]): The pending documents, cleared once the write was attempted.
+        """
+        if not buf:
+            return
+        injection_timestamp = datetime.now()
+        ops = [InsertOne({**data, 'injection_timestamp': injection_timestamp}) for data in buf]
+        try:
+            col.bulk_write(ops, ordered=False)
+            logger.info(f"{len(ops)} documents appended to {col.database.name} at {injection_timestamp}.")
+        except BulkWriteError as e:
+            failed = [buf[error['index']] for error in e.details.get('writeErrors', [])]
+            logger.error(f"{len(failed)} of {len(ops)} documents not appended to {col.database.name}: {failed}")
+        except PyMongoError as e:
+            logger.error(f"Failed to append {len(ops)} documents to {col.database.name}. Error: {e}. "
+                         f"Documents: {buf}")
+        finally:
+            buf.clear()
+
+    def close(self) -> None:
+        """Flush all pending data and close the MongoDB connection."""
+        self._flush(self.meta_col, self._buf['meta'])
+        self._flush(self.failed_col, self._buf['failed'])
+        self.client.close()
     
-    def get_last_book_by_department(self, department_code: str) -> int:
+    def get_last_book_by_department(self, department_code: str) -> Optional[str]:
         """Retrieve last book code with a specific department code from the metadata database.
 
         Args:
             department_code (str): The department code to search for.
 
         Returns:
-            int: a code of last book matching the department code.
+            Optional[str]: a code of last book matching the department code, None if there is none.
+        """
+        book = self.meta_col.find_one({'id': {'$gte': f'{department_code}/', 
+                                              '$lt': f'{department_code}/\uffff'}},
+                                      {'id': 1, '_id': 0}, sort=[('id', -1)])
+        return book['id'].split('/')[1] if book else None
+
+    def get_last_failed_book_by_department(self, department_code: str) -> Optional[str]:
+        """Retrieve last book code of a department that failed for a definitive reason.
+
+        Books that failed with API_EXCEPTION are left out, so that they are retried.
+
+        Args:
+            department_code (str): The department code to search for.
+
+        Returns:
+            Optional[str]: a code of last failed book matching the department code, None if there is none.
         """
-        books = self.books_metadata_db['data'].find({'id': {'$regex': f'^{department_code}/'}}, 
-                                                    {'id': 1})
-        
-        return max([book['id'].split('/')[1] for book in books if '/' in book['id']], default = None)
\ No newline at end of file
+        book = self.failed_col.find_one({'book_id': {'$gte': f'{department_code}/', 
+                                                     '$lt': f'{department_code}/\uffff'},
+                                         'reason': {'$ne': 'API_EXCEPTION'}},
+                                        {'book_id': 1, '_id': 0}, sort=[('book_id', -1)])
+        return book['book_id'].split('/')[1] if book else None
@@ -1,18 +1,20 @@
 import re
 import time 
 import configparser
+import functools
 import logging
-import threading
-import queue
-from typing import Dict, List, Any
+import multiprocessing
+from typing import Dict, List, Any, Iterator, Tuple
 
+import numpy as np
 from selenium.webdriver.remote.webdriver import WebDriver
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import (
     NoSuchElementException,
-    ElementClickInterceptedException,
+    JavascriptException,
+    TimeoutException,
 )
 
 import setup 
@@ -21,10 +23,60 @@ import database
 
 setup.LoggerSetup()
 logger = logging.getLogger()
-db = database.MongoDBHandler()
+_db = None
 element_exp = lambda id_, driver: driver.find_element(By.ID, id_)
+_ALPHABET = b"0123456789XABCDEFGHIJKLMNOPRSTUWYZ"
 
 
+def _build_lut(alphabet: bytes) -> bytearray:
+    """Build a table mapping each byte to its position in the alphabet.
+
+    Args:
+        alphabet (bytes): The characters allowed in a book code, in value order.
+
+    Returns:
+        bytearray: 256 character values, 0xff for bytes outside the alphabet.
+    """
+    lut = bytearray(b'\xff' * 256)
+    for value, char in enumerate(alphabet):
+        lut[char] = value
+    return lut
+
+
+_LUT = _build_lut(_ALPHABET)
+_SUBMIT_JS = """
+const d = document;
+const fields = ['kodWydzialuInput', 'numerKsiegiWieczystej', 'cyfraKontrolna'];
+fields.forEach((id, i) => {
+    const el = d.getElementById(id);
+    el.value = arguments[i];
+    el.dispatchEvent(new Event('change', {bubbles: true}));
+});
+d.getElementById('wyszukaj').click();
+"""
+_SEARCH_STATUS_JS = """
+const ctrl = document.getElementById('cyfraKontrolna--cyfra-kontrolna');
+if (ctrl && ctrl.offsetParent) return 'BAD_CTRL';
+if (document.readyState === 'loading') return null;
+const text = document.body.innerText;
+if (text.includes('nie została odnaleziona')) return 'NOT_FOUND';
+if (text.includes('Wynik wyszukiwania księgi wieczystej')) return 'FOUND';
+return null;
+"""
+_SECTION_BUTTONS = {section: (By.CSS_SELECTOR, f'input[type="submit"][value="{section}"]') 
+                    for section in ['Dział I-O', 'Dział I-Sp', 'Dział II', 'Dział III', 'Dział IV']}
+_META_COLUMNS = (
+    'Numer księgi wieczystej',
+    'Typ księgi wieczystej',
+    'Oznaczenie wydziału prowadzącego księgę wieczystą',
+    'Data zapisania księgi wieczystej',
+    'Położenie',
+    'Właściciel / użytkownik wieczysty / uprawniony',
+)
+_META_RE = re.compile(r'(' + '|'.join(re.escape(col) for col in _META_COLUMNS) + r')\s*\n([^\n]+)')
+
+
+@functools.lru_cache(maxsize=1)
 def get_config() -> Dict[str, Any]:
     """Retrieve configuration settings from 'config.ini'.
 
@@ -41,6 +93,18 @@ def get_config() -> Dict[str, Any]:
         raise KeyError(f"Section not found in config. Error: {e}")
 
 
+def _get_db() -> database.MongoDBHandler:
+    """Return the MongoDB handler of the current process, creating it on first use.
+
+    Returns:
+        database.MongoDBHandler: The process-wide MongoDB handler.
+    """
+    global _db
+    if _db is None:
+        _db = database.MongoDBHandler()
+    return _db
+
+
 def get_department_codes(driver: WebDriver) -> List[str]:
     """Fetch department codes from dropdown
 
@@ -77,25 +141,68 @@ class EvidenceBook:
         self.department_code = department_code
         self.url = url
         self.sleep = int(get_config().get('ERROR_SLEEP', 300))  
+        dept_values = self._char_values(department_code)
+        self._dept_partial = sum(v * w for v, w in 
+                                 zip(dept_values, [1, 3, 7] * ((len(department_code) + 2) // 3)))
+        self._suffix_weights = ([1, 3, 7] * 4)[len(department_code) % 3:][:8]
 
     @staticmethod
-    def __char_value(char: str) -> int:
-        return "0123456789XABCDEFGHIJKLMNOPRSTUWYZ".index(char)
+    def _char_values(code: str) -> List[int]:
+        """Map each character of a department code to its control number value.
 
-    def get_control_number(self, department_code: str, number: str) -> int:
-        """Calculate the control number for a given department code and number.
+        Args:
+            code (str): The department code.
+
+        Returns:
+            List[int]: The value of each character.
+
+        Raises:
+            ValueError: If the code contains a character without a value.
+        """
+        values = [_LUT[b] for b in code.encode('ascii', errors='replace')]
+        if 0xff in values:
+            raise ValueError(f"Invalid department code: {code}")
+        return values
+
+    def get_control_number(self, number: str) -> int:
+        """Calculate the control number for the department code and a given number.
+
+        This is the scalar reference for iter_control_numbers, which computes the sourcing range.
 
         Args:
-            department_code (str): The department code.
             number (str): The book number.
 
         Returns:
             int: Calculated control number.
+
+        Raises:
+            ValueError: If the number is not made of ASCII digits.
         """
-        full_number = department_code + number
-        weights = [1, 3, 7] * ((len(full_number) + 2) // 3) 
-        total_sum = sum(self.__char_value(char) * weights[i] for i, char in enumerate(full_number))
-        return total_sum % 10
+        if not (number.isascii() and number.isdigit()):
+            raise ValueError(f"Invalid book number: {number}")
+        return (self._dept_partial + 
+                sum(_LUT[b] * w for b, w in zip(number.encode('ascii'), self._suffix_weights))) % 10
+
+    def iter_control_numbers(self, start: int = 0, stop: int = int(1e8), 
+                             chunk_size: int = int(1e6)) -> Iterator[Tuple[str, str]]:
+        """Yield book numbers with their control numbers, computed in vectorized chunks.
+
+        Args:
+            start (int): The first book number.
+            stop (int): The book number to stop before.
+            chunk_size (int): How many control numbers to compute at once.
+
+        Yields:
+            Tuple[str, str]: The zero-padded book number and its control number.
+        """
+        powers = 10 ** np.arange(7, -1, -1, dtype=np.int32)
+        weights = np.array(self._suffix_weights, dtype=np.int32)
+        for chunk_start in range(start, stop, chunk_size):
+            numbers = np.arange(chunk_start, min(chunk_start + chunk_size, stop), dtype=np.int32)
+            digits = (numbers[:, None] // powers) % 10
+            control = (self._dept_partial + digits @ weights) % 10
+            for number, control_number in zip(numbers.tolist(), control.tolist()):
+                yield f'{number:08}', str(control_number)
     
     @staticmethod
     def get_land_register_info_from_metadata(metadata: str) -> Dict[str, str]:
@@ -107,22 +214,15 @@ class EvidenceBook:
         Returns:
             Dict[str, str]: Extracted land register information.
         """
+        found = {}
+        for match in _META_RE.finditer(metadata):
+            found.setdefault(match.group(1), match.group(2).strip())
+
         extracted_metadata = {}
-        columns = [
-            'Numer księgi wieczystej',
-            'Typ księgi wieczystej',
-            'Oznaczenie wydziału prowadzącego księgę wieczystą',
-            'Data zapisania księgi wieczystej',
-            'Położenie',
-            'Właściciel / użytkownik wieczysty / uprawniony',
-        ]
-
-        for col in columns:
-            try:
-                extracted_metadata[col] = re.search(col + r'\s*\n([^\n]+)', metadata).group(1).strip()
-            except Exception as e:
-                logger.warning(f"Failed to extract info for column '{col}'. Error: {e}")
-                extracted_metadata[col] = ""
+        for col in _META_COLUMNS:
+            if col not in found:
+                logger.warning(f"Failed to extract info for column '{col}'.")
+            extracted_metadata[col] = found.get(col, "")
         return extracted_metadata
     
     def get_sections_content(self) -> Dict[str, str]:
@@ -132,13 +232,16 @@ class EvidenceBook:
             Dict[str, str]: sections content information.
         """
         sections_content = {}
-        sections = ['Dział I-O', 'Dział I-Sp', 'Dział II', 'Dział III', 'Dział IV']
 
-        for section in sections:
+        for section, button in _SECTION_BUTTONS.items():
             try:
-                self.driver.find_element(By.CSS_SELECTOR, f'input[type="submit"][value="{section}"]').click()
-                sections_content[section] = element_exp("contentDzialu", self.driver).text
-                time.sleep(0.5)
+                previous_content = self.driver.find_elements(By.ID, 'contentDzialu')
+                self.driver.find_element(*button).click()
+                wait = WebDriverWait(self.driver, 5)
+                if previous_content:
+                    wait.until(EC.staleness_of(previous_content[0]))
+                content = wait.until(EC.presence_of_element_located((By.ID, 'contentDzialu')))
+                sections_content[section] = content.text
             except Exception as e:
                 logger.warning(f"Failed to get department content for {section}. Error: {e}")
                 sections_content[section] = ""
@@ -164,157 +267,150 @@ class EvidenceBook:
             logger.warning("Failed to find the book search results. Error: {e}")
         return {}
 
-    def enter_identification_details(self, identification: Dict[str, str]) -> bool:
+    def _reload_page(self) -> None:
+        """Wait out the error sleep and load the search form from scratch."""
+        time.sleep(self.sleep)
+        self.driver.get(self.url)
+        self.driver.refresh()
+
+    def enter_identification_details(self, id_book: str, control_number: str) -> bool:
         """Enter the identification details into the web form.
 
         Args:
-            identification (Dict[str, str]): The identification details.
+            id_book (str): The book number.
+            control_number (str): The control number of the book.
 
         Returns:
             bool: True if successful, False otherwise.
         """
         try:
-            for element, key in identification.items():
-                element_exp(element, self.driver).send_keys(key)
-            element_exp('wyszukaj', self.driver).click()
-            time.sleep(0.5)
+            self.driver.execute_script(_SUBMIT_JS, self.department_code, id_book, control_number)
             return True
-        except (NoSuchElementException, ElementClickInterceptedException) as e:
+        except JavascriptException as e:
             logger.error(f"Error entering identification details: {e}")
-            time.sleep(self.sleep)
-            self.driver.get(self.url)
-            self.driver.refresh()
+            self._reload_page()
             return False
 
-    def is_control_number_incorrect(self, book_code: str) -> bool:
-        """Check if the control number is incorrect.
+    def get_search_status(self, book_code: str) -> str:
+        """Wait for the outcome of a submitted search.
 
         Args:
             book_code (str): The book code.
 
         Returns:
-            bool: True if the control number is incorrect, False otherwise.
-        """
-        try:
-            if element_exp('cyfraKontrolna--cyfra-kontrolna', self.driver).is_displayed():
-                logger.warning(f"Incorrect control number for {book_code}")
-                return True
-        except NoSuchElementException:
-            logger.info(f"Book with identification {book_code} has correct control number.")
-        return False
-
-    def is_book_found(self) -> bool:
-        """Check if the book is found on the web page.
-
-        Returns:
-            bool: True if the book is found, False otherwise.
+            str: 'BAD_CTRL', 'NOT_FOUND' or 'FOUND', or 'ERROR' if no outcome appeared in time.
         """
         try:
-            WebDriverWait(self.driver, 30).until(
-                lambda d: d.execute_script('return document.readyState') == 'complete'
+            return WebDriverWait(self.driver, 30, poll_frequency=0.1, ignored_exceptions=[JavascriptException]).until(
+                lambda d: d.execute_script(_SEARCH_STATUS_JS)
             )
-            page_text = self.driver.find_element(By.TAG_NAME, 'body').text
-            return 'nie została odnaleziona' not in page_text
-        except NoSuchElementException:
-            logger.warning("Exception during checking if the book is found.")
-            return False
+        except TimeoutException:
+            logger.warning(f"No search result for {book_code}.")
+            return 'ERROR'
 
     def run_book_sourcing(self) -> None:
         """Run the book sourcing process to retrieve and print book information."""
-        existing_department_books = db.get_last_book_by_department(self.department_code)
-        iteration_range = range(int(existing_department_books) + 1, int(1e8)) \
-                          if existing_department_books else range(int(1e8))
+        last_books = [_get_db().get_last_book_by_department(self.department_code),
+                      _get_db().get_last_failed_book_by_department(self.department_code)]
+        start = max((int(book) + 1 for book in last_books if book), default=0)
                               
-        for number in iteration_range:
-            id_book = f'{number:08}'
-            control_number = str(self.get_control_number(self.department_code, id_book))
-
-            identification = {
-                'kodWydzialuInput': self.department_code,
-                'numerKsiegiWieczystej': id_book,
-                'cyfraKontrolna': control_number,
-            }
-            book_code = "/".join(identification.values())
-
-            if not self.enter_identification_details(identification):
-                db.append_to_failed_books(book_code, "API_EXCEPTION")
-                continue
+        for id_book, control_number in self.iter_control_numbers(start):
+            book_code = f"{self.department_code}/{id_book}/{control_number}"
 
-            elif self.is_control_number_incorrect(book_code):
-                db.append_to_failed_books(book_code, "INCORRECT_CONTROL_NUMBER")
+            if not self.enter_identification_details(id_book, control_number):
+                _get_db().append_to_failed_books(book_code, "API_EXCEPTION")
                 continue
 
-            elif self.is_book_found():
+            status = self.get_search_status(book_code)
+            if status == 'BAD_CTRL':
+                logger.warning(f"Incorrect control number for {book_code}")
+                _get_db().append_to_failed_books(book_code, "INCORRECT_CONTROL_NUMBER")
+                # The error stays on the form, so reload it before the next book is probed.
+                self.driver.get(self.url)
+            elif status == 'FOUND':
                 content = self.get_book_content()
                 content['id'] = book_code
-                db.append_to_books_metadata(content)
+                _get_db().append_to_books_metadata(content)
                 self.driver.get(self.url)
-            else:
+            elif status == 'NOT_FOUND':
                 logger.warning(f"Book {book_code} has not been found.")
-                db.append_to_failed_books(book_code, "NOT_FOUND")
-                element_exp('powrotDoKryterii', self.driver).click()
+                _get_db().append_to_failed_books(book_code, "NOT_FOUND")
+                self.driver.back()
+            else:
+                _get_db().append_to_failed_books(book_code, "API_EXCEPTION")
+                self._reload_page()
 
 
-def run_sourcing_for_department(driver: WebDriver, department_queue: queue.Queue, url: str, lock: threading.Lock):
-    """Run the book sourcing process for departments in a queue.
+def run_sourcing_for_department(department_queue: multiprocessing.Queue, url: str, lock: multiprocessing.Lock):
+    """Run the book sourcing process for departments in a queue, using a driver owned by this process.
 
     Args:
-        driver (webdriver.Chrome): The WebDriver instance to use.
-        department_queue (queue.Queue): Queue of departments to process.
+        department_queue (multiprocessing.Queue): Queue of departments to process, terminated by None.
         url (str): The URL of the web page to interact with.
-        lock (threading.Lock): Lock for synchronization.
+        lock (multiprocessing.Lock): Lock for synchronization.
     """
-    while not department_queue.empty():
-        try:
-            department = department_queue.get_nowait()
-        except queue.Empty:
-            break
-
+    driver = setup.WebDriverSetup(nr_instances=1, url=url).get_drivers()[0]
+    if driver is None:
         with lock:
-            logger.info(f"Driver {threading.current_thread().name} processing department: {department}")
+            logger.error(f"Driver {multiprocessing.current_process().name} failed to start, leaving departments "
+                         f"to other processes.")
+        return
 
-        try:
-            evidence_book = EvidenceBook(driver, department, url)
-            evidence_book.run_book_sourcing()
-        except Exception as e:
+    try:
+        for department in iter(department_queue.get, None):
             with lock:
-                logger.warning(f"Error processing department {department}: {e}")
-        finally:
-            department_queue.task_done()
+                logger.info(f"Driver {multiprocessing.current_process().name} processing department: {department}")
 
-    driver.quit()
+            try:
+                evidence_book = EvidenceBook(driver, department, url)
+                evidence_book.run_book_sourcing()
+            except Exception as e:
+                with lock:
+                    logger.warning(f"Error processing department {department}: {e}")
+    finally:
+        try:
+            if _db is not None:
+                _db.close()
+        finally:
+            driver.quit()
     
-def parallel_book_sourcing(drivers: List[WebDriver], departments: List[str], url: str) -> None:
-    """Run sourcing in parallel across multiple drivers and departments.
+def parallel_book_sourcing(nr_processes: int, departments: List[str], url: str) -> None:
+    """Run sourcing in parallel across multiple processes and departments.
 
     Args:
-        drivers (List[WebDriver]): List of WebDriver instances.
+        nr_processes (int): Number of worker processes, each with its own WebDriver.
         departments (List[str]): List of departments to process.
         url (str): The URL of the web page to interact with.
     """
-    department_queue = queue.Queue()
+    department_queue = multiprocessing.Queue()
     for department in departments:
         department_queue.put(department)
+    for _ in range(nr_processes):
+        department_queue.put(None)
 
-    lock = threading.Lock()
-    threads = []
+    lock = multiprocessing.Lock()
+    processes = []
 
-    for driver in drivers:
-        thread = threading.Thread(
+    for i in range(nr_processes):
+        process = multiprocessing.Process(
             target=run_sourcing_for_department,
-            args=(driver, department_queue, url, lock),
-            name=f"DriverThread-{drivers.index(driver)}"
+            args=(department_queue, url, lock),
+            name=f"DriverProcess-{i}"
         )
-        threads.append(thread)
-        thread.start()
+        processes.append(process)
+        process.start()
 
-    for thread in threads:
-        thread.join()
+    for process in processes:
+        process.join()
 
     
 if __name__ == "__main__":
-    drivers_setup = setup.WebDriverSetup(nr_instances = int(get_config()['NUMBER_OF_PROCESSES']))
-    drivers = drivers_setup.get_drivers()
-    depatmnet_codes = get_department_codes(drivers[0])
-    
-    parallel_book_sourcing(drivers, depatmnet_codes, drivers_setup._get_url())
+    url = setup.WebDriverSetup._get_url()
+    driver = setup.WebDriverSetup(url=url).get_drivers()[0]
+    if driver is None:
+        logger.error("Driver for fetching department codes failed to start, sourcing not started.")
+    else:
+        depatmnet_codes = get_department_codes(driver)
+        driver.quit()
+        
+        parallel_book_sourcing(int(get_config()['NUMBER_OF_PROCESSES']), depatmnet_codes, url)
@@ -4,7 +4,8 @@ from datetime import datetime
 import logging
 from logging.handlers import TimedRotatingFileHandler
 import configparser
-from typing import List
+import functools
+from typing import List, Optional
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -52,11 +53,13 @@ class WebDriverSetup:
     Attributes:
         headless (bool): A flag to indicate whether browsers should be headless.
         nr_instances (int): The number of WebDriver instances to create.
+        url (str): The URL each WebDriver opens, read from config if not given.
         drivers (List[WebDriver]): A list of initialized WebDriver instances.
     """
-    def __init__(self, headless: bool = False, nr_instances: int = 1) -> None:
+    def __init__(self, headless: bool = True, nr_instances: int = 1, url: Optional[str] = None) -> None:
         self.headless = headless
         self.nr_instances = nr_instances
+        self.url = url or self._get_url()
         self.drivers: List[WebDriver] = []
         
     def create_driver(self) -> WebDriver:
@@ -73,6 +76,13 @@ class WebDriverSetup:
         chrome_options.add_argument("--disable-extensions")
         chrome_options.add_argument("--disable-popup-blocking")
         chrome_options.add_argument(f"--user-data-dir=/tmp/chrome-profile-{int(time.time())}")
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_argument("--disable-images")
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.default_content_setting_values.notifications": 2,
+        })
+        chrome_options.page_load_strategy = 'eager'
         if self.headless:
             chrome_options.add_argument("--headless")
 
@@ -94,6 +104,7 @@ class WebDriverSetup:
             logger.warning(f"Clicking cookies accept failed with error: {e}")
     
     @staticmethod 
+    @functools.lru_cache(maxsize=1)
     def _get_url() -> str:
         """Retrieve the URL from a configuration file.
 
@@ -104,7 +115,7 @@ class WebDriverSetup:
         if not config.read('config.ini'):
             raise FileNotFoundError("Config file 'config.ini' not found.")
         try:
-            return str(config['General']['URL'])[1:-1]
+            return config['General']['URL'].strip('"\'')
         except KeyError as e:
             raise KeyError(f"URL not found in config. Error: {e}")
 
@@ -117,7 +128,7 @@ class WebDriverSetup:
         logger.info("Starting WebDriver initialization.")
         try:
             driver = self.create_driver()
-            driver.get(self._get_url())
+            driver.get(self.url)
             driver.delete_all_cookies()
             driver.execute_script("window.localStorage.clear();")
             driver.execute_script("window.sessionStorage.clear();")
@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import patch
+from pymongo import InsertOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from database import MongoDBHandler
+
+
+class TestMongoDBHandler(unittest.TestCase):
+    def setUp(self):
+        patcher = patch('database.MongoClient')
+        self.mock_client = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('database.atexit.register')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.handler = MongoDBHandler()
+        self.handler._BATCH['failed'] = 2
+
+    def test_append_buffers_until_batch_is_full(self):
+        """Test documents are buffered and flushed once the batch size is reached """
+        self.handler.append_to_failed_books('KI1I/00000001/6', 'NOT_FOUND')
+        self.handler.failed_col.bulk_write.assert_not_called()
+        self.assertEqual(len(self.handler._buf['failed']), 1)
+
+        with patch('database.datetime') as mock_datetime:
+            self.handler.append_to_failed_books('KI1I/00000002/3', 'NOT_FOUND')
+        timestamp = mock_datetime.now.return_value
+        self.handler.failed_col.bulk_write.assert_called_once_with([
+            InsertOne({'book_id': 'KI1I/00000001/6', 'reason': 'NOT_FOUND', 'injection_timestamp': timestamp}),
+            InsertOne({'book_id': 'KI1I/00000002/3', 'reason': 'NOT_FOUND', 'injection_timestamp': timestamp}),
+        ], ordered=False)
+        self.assertEqual(self.handler._buf['failed'], [])
+
+    def test_metadata_is_written_immediately(self):
+        """Test found books are not held in a buffer """
+        self.handler.append_to_books_metadata({'id': 'KI1I/00000003/0'})
+        self.handler.meta_col.bulk_write.assert_called_once()
+        self.assertEqual(self.handler._buf['meta'], [])
+
+    def test_failed_flush_writes_pending_metadata_first(self):
+        """Test failed books are never stored ahead of buffered metadata of earlier books """
+        self.handler._BATCH['meta'] = 5
+        writes = []
+        self.handler.meta_col.bulk_write.side_effect = lambda ops, **kwargs: writes.append('meta')
+        self.handler.failed_col.bulk_write.side_effect = lambda ops, **kwargs: writes.append('failed')
+
+        self.handler.append_to_books_metadata({'id': 'KI1I/00000001/6'})
+        self.handler.append_to_failed_books('KI1I/00000002/3', 'NOT_FOUND')
+        self.assertEqual(writes, [])
+        self.handler.append_to_failed_books('KI1I/00000003/0', 'NOT_FOUND')
+        self.assertEqual(writes, ['meta', 'failed'])
+        self.assertEqual(self.handler._buf, {'failed': [], 'meta': []})
+
+    def test_close_flushes_pending_data(self):
+        """Test close writes partial batches and closes the client """
+        self.handler.append_to_failed_books('KI1I/00000001/6', 'NOT_FOUND')
+        self.handler.failed_col.bulk_write.assert_not_called()
+        self.handler.close()
+        self.handler.failed_col.bulk_write.assert_called_once()
+        self.mock_client.return_value.close.assert_called_once_with()
+
+    def test_flush_failure_is_not_resent(self):
+        """Test a failed bulk write is logged once and not repeated on later appends """
+        self.handler._BATCH['meta'] = 2
+        self.handler.meta_col.bulk_write.side_effect = [
+            BulkWriteError({'writeErrors': [{'index': 1, 'errmsg': 'duplicate key'}]}),
+            AutoReconnect('connection lost'),
+            None,
+        ]
+        with self.assertLogs(level='ERROR') as logs:
+            for i in range(6):
+                self.handler.append_to_books_metadata({'id': f'KI1I/{i:08}/0'})
+
+        batch_sizes = [len(c.args[0]) for c in self.handler.meta_col.bulk_write.call_args_list]
+        self.assertEqual(batch_sizes, [2, 2, 2])
+        self.assertIn("KI1I/00000001/0", logs.output[0])
+        self.assertNotIn("KI1I/00000000/0", logs.output[0])
+        self.assertEqual(self.handler._buf['meta'], [])
+
+    def test_get_last_failed_book_by_department(self):
+        """Test the last definitive failure is read with one indexed, sorted query """
+        self.handler.failed_col.find_one.return_value = {'book_id': 'KI1I/00000042/7'}
+        self.assertEqual(self.handler.get_last_failed_book_by_department('KI1I'), '00000042')
+        query, projection = self.handler.failed_col.find_one.call_args.args
+        self.assertEqual(query['book_id'], {'$gte': 'KI1I/', '$lt': 'KI1I/\uffff'})
+        self.assertEqual(query['reason'], {'$ne': 'API_EXCEPTION'})
+        self.assertEqual(self.handler.failed_col.find_one.call_args.kwargs['sort'], [('book_id', -1)])
+
+        self.handler.failed_col.find_one.return_value = None
+        self.assertIsNone(self.handler.get_last_failed_book_by_department('KI1I'))
+
+
+if __name__ == '__main__':
+    unittest.main()
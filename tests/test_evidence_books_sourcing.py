@@ -1,12 +1,17 @@
 import unittest
-from unittest.mock import patch, MagicMock, create_autospec
+from unittest.mock import patch, call, MagicMock, create_autospec
 from selenium.webdriver.remote.webdriver import WebDriver
 from selenium.webdriver.remote.webelement import WebElement
+from selenium.common.exceptions import WebDriverException
 
+import evidence_books_sourcing
 from evidence_books_sourcing import (
     EvidenceBook,
+    _SUBMIT_JS,
+    _get_db,
     get_config,
     get_department_codes,
+    run_sourcing_for_department,
 )
 
 class TestEvidenceBook(unittest.TestCase):
@@ -20,9 +25,25 @@ class TestEvidenceBook(unittest.TestCase):
     @patch('evidence_books_sourcing.element_exp')
     def test_get_control_number(self, mock_element_exp):
         """Test control number calculation """
-        control_number = self.evidence_book.get_control_number(self.department_code, "00000008")
+        control_number = self.evidence_book.get_control_number("00000008")
         self.assertEqual(control_number, 0, "Control number should be calculated as 0")
 
+    def test_get_control_number_rejects_invalid_characters(self):
+        """Test characters outside the control number alphabet are rejected """
+        for number in ['0000000a', '0000000Q', '0000000ł']:
+            with self.subTest(number=number):
+                with self.assertRaises(ValueError):
+                    self.evidence_book.get_control_number(number)
+        with self.assertRaises(ValueError):
+            EvidenceBook(self.mock_driver, "KQ1I", self.url)
+
+    def test_iter_control_numbers(self):
+        """Test vectorized control numbers match the scalar calculation """
+        control_numbers = list(self.evidence_book.iter_control_numbers(99990, 100010, chunk_size=7))
+        expected = [(f'{n:08}', str(self.evidence_book.get_control_number(f'{n:08}'))) 
+                    for n in range(99990, 100010)]
+        self.assertEqual(control_numbers, expected, "Vectorized control numbers should match")
+
     @patch('evidence_books_sourcing.element_exp')
     def test_get_land_register_info_from_metadata(self, mock_element_exp):
         """Test extraction of metadata from a string """
@@ -45,32 +66,115 @@ class TestEvidenceBook(unittest.TestCase):
         }
         self.assertEqual(extracted_metadata, expected_metadata, "Metadata extraction failed")
 
-    @patch('evidence_books_sourcing.element_exp')
-    def test_enter_identification_details(self, mock_element_exp):
+    def test_enter_identification_details(self):
         """Test entering identification details """
-        identification = {
-            'kodWydzialuInput': self.department_code,
-            'numerKsiegiWieczystej': '00000001',
-            'cyfraKontrolna': '6',
-        }
-        mock_element = MagicMock()
-        mock_element_exp.return_value = mock_element
-
-        success = self.evidence_book.enter_identification_details(identification)
+        success = self.evidence_book.enter_identification_details('00000001', '6')
         self.assertTrue(success, "Identification details should be entered successfully")
-        mock_element_exp.assert_any_call('kodWydzialuInput', self.mock_driver)
-        mock_element_exp.assert_any_call('numerKsiegiWieczystej', self.mock_driver)
-        mock_element_exp.assert_any_call('cyfraKontrolna', self.mock_driver)
-        mock_element_exp.assert_any_call('wyszukaj', self.mock_driver)
+        self.mock_driver.execute_script.assert_called_once_with(
+            _SUBMIT_JS, self.department_code, '00000001', '6'
+        )
+
+    def test_get_search_status(self):
+        """Test routing on the search status reported by the page """
+        self.mock_driver.execute_script.side_effect = [None, 'NOT_FOUND']
+        status = self.evidence_book.get_search_status('KI1I/00000001/6')
+        self.assertEqual(status, 'NOT_FOUND', "Search status should be read from the page")
+        self.assertEqual(self.mock_driver.execute_script.call_count, 2)
+
+    @patch('evidence_books_sourcing.EC')
+    @patch('evidence_books_sourcing.WebDriverWait')
+    def test_get_sections_content(self, mock_webdriver_wait, mock_ec):
+        """Test each section waits for the previous section page to be replaced """
+        texts = ['Dział I-O', 'Brak wpisów', 'Brak wpisów', 'Dział III', 'Dział IV']
+        previous_content = MagicMock(spec=WebElement)
+        self.mock_driver.find_elements.side_effect = [[]] + [[previous_content]] * 4
+        until_results = [MagicMock(spec=WebElement, text=texts[0])]
+        for text in texts[1:]:
+            until_results += [True, MagicMock(spec=WebElement, text=text)]
+        mock_webdriver_wait.return_value.until.side_effect = until_results
+
+        sections_content = self.evidence_book.get_sections_content()
+        self.assertEqual(list(sections_content.values()), texts)
+        self.assertEqual(mock_ec.staleness_of.call_args_list, [call(previous_content)] * 4)
+        mock_webdriver_wait.return_value.until.assert_any_call(mock_ec.staleness_of.return_value)
+
+    @patch('evidence_books_sourcing._get_db')
+    def test_run_book_sourcing_resumes_after_last_sourced_book(self, mock_get_db):
+        """Test sourcing resumes after the latest stored or definitively failed book """
+        for last_found, last_failed, expected_start in [(None, None, 0), ('00000010', None, 11),
+                                                        (None, '00000007', 8), ('00000010', '00000015', 16),
+                                                        ('00000020', '00000015', 21)]:
+            with self.subTest(last_found=last_found, last_failed=last_failed):
+                mock_get_db.return_value.get_last_book_by_department.return_value = last_found
+                mock_get_db.return_value.get_last_failed_book_by_department.return_value = last_failed
+                with patch.object(self.evidence_book, 'iter_control_numbers', return_value=iter([])) as mock_iter:
+                    self.evidence_book.run_book_sourcing()
+                mock_iter.assert_called_once_with(expected_start)
+
+    @patch('evidence_books_sourcing._get_db')
+    def test_run_book_sourcing_reloads_form_after_bad_control_number(self, mock_get_db):
+        """Test a rejected control number is not left on the form for the next book's probe """
+        mock_get_db.return_value.get_last_book_by_department.return_value = None
+        mock_get_db.return_value.get_last_failed_book_by_department.return_value = None
+        self.mock_driver.execute_script.side_effect = [None, 'BAD_CTRL', None, 'NOT_FOUND']
+
+        with patch.object(self.evidence_book, 'iter_control_numbers', 
+                          return_value=iter([('00000001', '6'), ('00000002', '3')])):
+            self.evidence_book.run_book_sourcing()
+
+        driver_calls = [name for name, _, _ in self.mock_driver.mock_calls]
+        self.assertEqual(driver_calls, ['execute_script', 'execute_script', 'get', 
+                                        'execute_script', 'execute_script', 'back'])
+        self.mock_driver.get.assert_called_once_with(self.url)
+        mock_get_db.return_value.append_to_failed_books.assert_has_calls([
+            call('KI1I/00000001/6', 'INCORRECT_CONTROL_NUMBER'),
+            call('KI1I/00000002/3', 'NOT_FOUND'),
+        ])
 
     def test_get_config(self):
         """Test retrieving configuration settings """
+        get_config.cache_clear()
+        self.addCleanup(get_config.cache_clear)
         with patch('evidence_books_sourcing.configparser.ConfigParser.read', return_value=True):
             with patch('evidence_books_sourcing.configparser.ConfigParser.__getitem__', return_value={'ERROR_SLEEP': '300'}):
                 config = get_config()
                 self.assertIn('ERROR_SLEEP', config, "Config should have 'ERROR_SLEEP'")
                 self.assertEqual(config['ERROR_SLEEP'], '300', "Config 'ERROR_SLEEP' should be '300'")
 
+    @patch('evidence_books_sourcing.database.MongoDBHandler')
+    def test_get_db(self, mock_handler):
+        """Test the MongoDB handler is created lazily, once per process """
+        self.assertIsNone(evidence_books_sourcing._db, "Importing should not connect to MongoDB")
+        self.addCleanup(setattr, evidence_books_sourcing, '_db', None)
+        self.assertIs(_get_db(), _get_db())
+        mock_handler.assert_called_once_with()
+
+    @patch('evidence_books_sourcing.EvidenceBook')
+    @patch('evidence_books_sourcing.setup.WebDriverSetup')
+    def test_run_sourcing_for_department_closes_db(self, mock_setup, mock_evidence_book):
+        """Test pending data is flushed even if the driver fails to quit """
+        mock_driver = mock_setup.return_value.get_drivers.return_value[0]
+        mock_driver.quit.side_effect = WebDriverException("chrome not reachable")
+        department_queue = MagicMock()
+        department_queue.get.side_effect = ['KI1I', None]
+
+        with patch('evidence_books_sourcing._db') as mock_db:
+            with self.assertRaises(WebDriverException):
+                run_sourcing_for_department(department_queue, self.url, MagicMock())
+            mock_db.close.assert_called_once_with()
+        mock_evidence_book.return_value.run_book_sourcing.assert_called_once_with()
+
+    @patch('evidence_books_sourcing.EvidenceBook')
+    @patch('evidence_books_sourcing.setup.WebDriverSetup')
+    def test_run_sourcing_for_department_without_driver(self, mock_setup, mock_evidence_book):
+        """Test a worker whose driver failed to start leaves the queue untouched """
+        mock_setup.return_value.get_drivers.return_value = [None]
+        department_queue = MagicMock()
+
+        run_sourcing_for_department(department_queue, self.url, MagicMock())
+        department_queue.get.assert_not_called()
+        mock_evidence_book.assert_not_called()
+
     @patch('evidence_books_sourcing.WebDriverWait')
     @patch('evidence_books_sourcing.element_exp')
     def test_get_department_codes(self, mock_element_exp, mock_webdriver_wait):
@@ -16,8 +16,12 @@ class TestSetup(unittest.TestCase):
     def test_create_driver(self, mock_chrome):
         """Test if create_driver method creates a Chrome driver correctly."""
         mock_chrome.return_value = MagicMock(spec=WebDriver)
-        driver = self.setup.create_driver()
+        driver = WebDriverSetup().create_driver()
         self.assertIsInstance(driver, WebDriver)
+        options = mock_chrome.call_args.kwargs['options']
+        self.assertIn("--headless", options.arguments)
+        self.assertIn("--blink-settings=imagesEnabled=false", options.arguments)
+        self.assertEqual(options.page_load_strategy, 'eager')
 
     @patch('setup.configparser.ConfigParser')
     def test_get_url(self, mock_config):
@@ -26,6 +30,8 @@ class TestSetup(unittest.TestCase):
         mock_parser.read.return_value = True
         mock_parser.__getitem__.return_value = {'URL': '"' + self.url + '"'}
         mock_config.return_value = mock_parser
+        WebDriverSetup._get_url.cache_clear()
+        self.addCleanup(WebDriverSetup._get_url.cache_clear)
         url = self.setup._get_url()
         self.assertEqual(url, self.url)
 